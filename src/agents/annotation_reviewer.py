@@ -64,7 +64,7 @@ class AnnotationReviewer:
             "# Annotated Information\n"
             "```\n/* The information annotated by the Annotator. Your task is to review this content. */\n```\n\n"
             "# Results of Tag Nesting Check\n"
-            "```\n*/{\"tags_properly_nested\":{True/False},\"{tag-name}\":[\"{fragment1}\",\"{fragment2}\", ...], ...}*/\n```\n\n"
+            "```\n*/{\"content\":{\"{tag-name}\":[\"{fragment1}\",\"{fragment2}\", ...], ...},\"tags_properly_nested\":{True/False}}*/\n```\n\n"
             "You need to give the review in the following format:\n\n"
             "{\"errors\":\"/* 1. The err info and your fix suggestions.*/\n/*2. ... ... */\n\","
             "\"suggestions\":\"/* 1. Your suggestions for optimization of the annotated information. "
@@ -4,8 +4,13 @@ import openpyxl
 import sqlite3
 import sys
 import hashlib
+import threading
 import yaml
 
+# 优先使用 libyaml 的 C 实现，未编译 libyaml 时回退到纯 Python 实现
+_YamlDumper = getattr(yaml, 'CDumper', yaml.Dumper)
+_YamlSafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 class ExcelChunkProcessor:
     def __init__(self, db_name='data.db'):
         """
@@ -16,6 +21,7 @@ class ExcelChunkProcessor:
         self.db_name = db_name
         self.table_info = []
         self.connected = False
+        self._lock = threading.RLock()  # 多线程共享连接时用于串行化数据库操作
         self.conn = self.create_connection()
         self._initialize_db()
 
@@ -29,7 +35,7 @@ class ExcelChunkProcessor:
         if db_file is None:
             db_file = self.db_name
         try:
-            conn = sqlite3.connect(db_file)
+            conn = sqlite3.connect(db_file, check_same_thread=False)
             self.connected = True
             return conn
         except sqlite3.Error as e:
@@ -109,10 +115,11 @@ class ExcelChunkProcessor:
         :param new_hash: 文件内容的新哈希值
         :return: 如果文件已处理且内容未变，返回 True；否则返回 False
         """
-        self.ensure_connected()
         query = "SELECT content_hash FROM processed_files WHERE file_path = ? AND sheet_name = ?"
-        cursor = self.conn.execute(query, (file_path, sheet_name))
-        result = cursor.fetchone()
+        with self._lock:
+            self.ensure_connected()
+            cursor = self.conn.execute(query, (file_path, sheet_name))
+            result = cursor.fetchone()
         if result:
             stored_hash = result[0]
             return stored_hash == new_hash
@@ -129,16 +136,17 @@ class ExcelChunkProcessor:
         :param columns: 表的列信息, 以YAML字符串形式存储
         :param summary: 表的摘要
         """
-        self.ensure_connected()
         insert_query = """
         INSERT INTO processed_files (file_path, sheet_name, content_hash, table_name, columns, summary) 
         VALUES (?, ?, ?, ?, ?, ?)
         ON CONFLICT(table_name) 
         DO UPDATE SET content_hash = excluded.content_hash, columns = excluded.columns, summary = excluded.summary
         """
-        columns_yaml = yaml.dump(columns, allow_unicode=True, default_flow_style=False)
-        self.conn.execute(insert_query, (file_path, sheet_name, content_hash, table_name, columns_yaml, summary))
-        self.conn.commit()
+        columns_yaml = yaml.dump(columns, Dumper=_YamlDumper, allow_unicode=True, default_flow_style=False)
+        with self._lock:
+            self.ensure_connected()
+            self.conn.execute(insert_query, (file_path, sheet_name, content_hash, table_name, columns_yaml, summary))
+            self.conn.commit()
 
     def update_summary(self, file_path, sheet_name, summary):
         """
@@ -165,14 +173,15 @@ class ExcelChunkProcessor:
         - 对于CSV文件，sheet_name参数应设置为None。
         - 此操作会覆盖之前存储的摘要信息。
         """
-        self.ensure_connected()
         update_query = """
         UPDATE processed_files 
         SET summary = ? 
         WHERE file_path = ? AND sheet_name = ?
         """
-        self.conn.execute(update_query, (summary, file_path, sheet_name))
-        self.conn.commit()
+        with self._lock:
+            self.ensure_connected()
+            self.conn.execute(update_query, (summary, file_path, sheet_name))
+            self.conn.commit()
 
     def get_summary(self, file_path, sheet_name):
         """
@@ -257,10 +266,10 @@ class ExcelChunkProcessor:
         :param summary: 文件摘要（可选）
         :return: 处理的表信息列表
         """
-        self.ensure_connected()
         processed_info = []
+        file_extension = os.path.splitext(file_path)[1].lower()
 
-        if file_path.endswith('.xlsx') and '~$' not in file_path:
+        if file_extension == '.xlsx' and '~$' not in file_path:
             excel_file = pd.ExcelFile(file_path)
             for sheet_name in excel_file.sheet_names:
                 df = excel_file.parse(sheet_name=sheet_name)
@@ -269,7 +278,9 @@ class ExcelChunkProcessor:
                 if self.is_file_processed(normalized_table, sheet_name, content_hash):
                     print(f"Skipping unchanged file: {file_path} | {sheet_name}")
                     continue
-                df.to_sql(normalized_table, self.conn, if_exists='replace', index=False)
+                with self._lock:
+                    self.ensure_connected()
+                    df.to_sql(normalized_table, self.conn, if_exists='replace', index=False)
                 columns = df.columns.tolist()
                 self._mark_file_as_processed(file_path, sheet_name, content_hash, normalized_table, columns, summary)
                 processed_info.append({
@@ -279,14 +290,16 @@ class ExcelChunkProcessor:
                     'columns': columns
                 })
 
-        elif file_path.endswith('.csv'):
+        elif file_extension == '.csv':
             df = pd.read_csv(file_path)
             content_hash = self.calculate_hash(df)
             normalized_table = self._normalize_table_name(file_path)
             if self.is_file_processed(normalized_table, None, content_hash):
                 print(f"Skipping unchanged file: {file_path}")
                 return []
-            df.to_sql(normalized_table, self.conn, if_exists='replace', index=False)
+            with self._lock:
+                self.ensure_connected()
+                df.to_sql(normalized_table, self.conn, if_exists='replace', index=False)
             columns = df.columns.tolist()
             self._mark_file_as_processed(file_path, None, content_hash, normalized_table, columns, summary)
             processed_info.append({
@@ -380,7 +393,7 @@ class ExcelChunkProcessor:
 
         for row in cursor.fetchall():
             file_path, sheet_name, table_name, columns = row
-            columns = yaml.safe_load(columns)
+            columns = yaml.load(columns, Loader=_YamlSafeLoader)
             if key in columns:
                 if is_exact_match:
                     if value is None or value == "":
@@ -412,13 +425,13 @@ class ExcelChunkProcessor:
                     }
 
                     # 将结果转换为排序后的YAML字符串
-                    unique_result = yaml.dump(result, sort_keys=True, allow_unicode=True, default_flow_style=False)
+                    unique_result = yaml.dump(result, Dumper=_YamlDumper, sort_keys=True, allow_unicode=True, default_flow_style=False)
                     unique_results.add(unique_result)
 
                     all_results.append(result)
 
         if is_unique_result:
-            results = [yaml.safe_load(r) for r in unique_results]
+            results = [yaml.load(r, Loader=_YamlSafeLoader) for r in unique_results]
         else:
             results = all_results
 
@@ -503,7 +516,7 @@ class ExcelChunkProcessor:
             headers[table_name] = {
                 'file_path': file_path,
                 'sheet_name': sheet_name,
-                'columns': yaml.safe_load(columns_yaml),
+                'columns': yaml.load(columns_yaml, Loader=_YamlSafeLoader),
                 'summary': summary,
                 'record_count': record_count
             }
@@ -20,6 +20,9 @@ from agentscope.utils.common import _join_str_with_comma_and
 from agentscope.agents import DialogAgent
 from agentscope.message import Msg
 
+# 优先使用 libyaml 的 C 实现解析模型响应，未编译 libyaml 时回退到纯 Python 实现
+_YamlSafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 YAML_FORMAT_RULES = """
 1. Short strings: Write directly.
 2. Multi-line strings: 
@@ -263,13 +266,13 @@ class MarkdownYAMLDictParser(ParserBase, DictFilterMixin):
 
         # 尝试解析YAML，如果失败则尝试修复
         try:
-            parsed_yaml = yaml.safe_load(extract_text)
+            parsed_yaml = yaml.load(extract_text, Loader=_YamlSafeLoader)
         except yaml.YAMLError as e:
             if self.fix_agent is not None:
                 logger.warning(f"YAML解析失败，尝试修复。错误: {e}")
                 fixed_yaml = self._fix_raw_response(raw_response, str(e))
                 try:
-                    parsed_yaml = yaml.safe_load(fixed_yaml)
+                    parsed_yaml = yaml.load(fixed_yaml, Loader=_YamlSafeLoader)
                     logger.info("YAML修复成功。")
                 except yaml.YAMLError as e2:
                     raise ResponseParsingError(
@@ -2,10 +2,12 @@
 
 import os
 import re
-from collections import defaultdict
 import yaml
 import importlib
-from functools import partial
+import tempfile
+import threading
+from functools import partial, lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from agentscope.message import Msg
 from agentscope.agents.user_agent import UserAgent
@@ -14,67 +16,190 @@ from goodrock_model_wrapper import GoodRockModelWrapper
 
 from agents.tools.excel_processor import ExcelChunkProcessor
 from agents.tools.execute_python_code import execute_python_code
-from agents.annotator import Annotator
-from agents.swe_agent import SWEAgent
-from agents.sql_designer import SQLDesigner
-from agents.data_extractor import DataExtractor
 
+# 支持导入数据库的表格文件扩展名
+_TABLE_EXTS = frozenset({'.xlsx', '.xls', '.csv'})
+
+# 优先使用 libyaml 的 C 实现进行序列化/解析，未编译 libyaml 时回退到纯 Python 实现
+_YamlDumper = getattr(yaml, 'CDumper', yaml.Dumper)
+_YamlSafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_safe_load_yaml = partial(yaml.load, Loader=_YamlSafeLoader)
+
+# check_nested_tags 使用的正则，模块加载时编译一次
+_TAG_RE = re.compile(r'<(/?[\w-]+)>')
+
+def _iter_data_files(root):
+    """
+    使用 os.scandir 遍历目录，产出其中所有表格文件的路径
+
+    :param root: 目录路径
+    """
+    stack = [root]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            # 与 os.walk 一致，跳过无法列出的目录（无权限或已被删除）
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                # 只检查文件名而非完整路径，跳过 Office 临时锁文件
+                name = entry.name
+                if name.startswith('~$'):
+                    continue
+                dot = name.rfind('.')
+                if dot != -1 and name[dot:].lower() in _TABLE_EXTS:
+                    yield entry.path
+
+# 标签配置文件解析缓存: {绝对路径: (修改时间, 标签字典)}
+_tag_config_cache = {}
+
+def _load_tag_config(tag_config):
+    """
+    加载标签配置，配置文件的解析结果按修改时间缓存
+
+    :param tag_config: 标签配置文件路径、YAML字符串，或包含'tags'键的字典
+    :return: 标注标签字典
+    """
+    if isinstance(tag_config, str):
+        if os.path.isfile(tag_config):
+            path = os.path.abspath(tag_config)
+            mtime = os.path.getmtime(path)
+            cached = _tag_config_cache.get(path)
+            if cached is None or cached[0] != mtime:
+                # 以二进制一次性读取，由 libyaml 直接解码 UTF-8
+                with open(path, "rb") as f:
+                    cached = (mtime, _safe_load_yaml(f.read()))
+                _tag_config_cache[path] = cached
+            # 调用方会修改返回的字典，缓存中保留原始结果
+            return dict(cached[1])
+        return _safe_load_yaml(tag_config)
+    elif isinstance(tag_config, dict):
+        if isinstance(tag_config['tags'], str):
+            # 新解析的字典不与外部共享，无需复制
+            return _safe_load_yaml(tag_config['tags'])
+        # 复制一份，避免 create_table_tags 修改调用方传入的字典
+        return dict(tag_config['tags'])
+    raise ValueError("Invalid tag_config format")
+
+@lru_cache(maxsize=256)
+def _parse_nested_tags(text):
+    # 返回不可变结果 (((tag, (content, ...)), ...), tags_properly_nested)，以便缓存重复的标注输出
+    if '<' not in text:
+        # 纯文本不可能包含标签，跳过所有正则扫描
+        return (), False
+
+    # 单遍扫描，同时检查嵌套并提取内容：
+    # 栈中保存 (标签名, 内容片段)，闭合时记录去除内部标签后的内容，并并入外层标签
+    tags_properly_nested = True
+    has_tag = False
+    tag_dict = {}
+    stack = []
+    pos = 0
+    for match in _TAG_RE.finditer(text):
+        has_tag = True
+        if stack:
+            stack[-1][1].append(text[pos:match.start()])
+        pos = match.end()
+        tag = match.group(1)
+        if tag[0] != '/':
+            stack.append((tag, []))
+            continue
+        tag = tag[1:]
+        if not stack or stack[-1][0] != tag:
+            tags_properly_nested = False
+            if not any(open_tag == tag for open_tag, _ in stack):
+                # 没有对应开始标签的闭合标签直接忽略
+                continue
+        # 交叉嵌套时，未闭合的内层标签内容并入外层
+        while stack[-1][0] != tag:
+            _, parts = stack.pop()
+            stack[-1][1].extend(parts)
+        _, parts = stack.pop()
+        content = ''.join(parts)
+        if content:
+            tag_dict.setdefault(tag, []).append(content)
+        if stack:
+            stack[-1][1].append(content)
 
-def check_nested_tags(text):
-    # Function to check if tags are properly nested
-    def check_tags(text):
-        has_tag = False
-        stack = []
-        tags = re.findall(r'<(/?[\w-]+)>', text)
-        for tag in tags:
-            has_tag = True
-            if not tag.startswith('/'):
-                stack.append(tag)
-            else:
-                if not stack or stack.pop() != tag[1:]:
-                    return False, has_tag
-        return not stack, has_tag
-
-    tags_properly_nested, has_tag = check_tags(text)
     if not has_tag:
-        return {'tags_properly_nested': False}
-
-    # Remove nested tags and create the dictionary
-    tag_pattern = re.compile(r'<(/?[\w-]+)>')
-    tag_content_pattern = re.compile(r'(<(?P<tag>[\w-]+)>)(?P<content>.+?)(</\2>)')
-    
-    tag_dict = defaultdict(list)
-
-    while tag_content_pattern.search(text):
-        for match in tag_content_pattern.finditer(text):
-            tag = match.group('tag')
-            content = match.group('content')
-            tag_dict[tag].append(tag_pattern.sub('', content))
-            text = text.replace(match.group(0), '', 1)
+        return (), False
+    if stack:
+        tags_properly_nested = False
 
-    tag_dict['tags_properly_nested'] = tags_properly_nested # type: ignore
+    return tuple((tag, tuple(contents)) for tag, contents in tag_dict.items()), tags_properly_nested
 
-    return dict(tag_dict)
+def check_nested_tags(text):
+    """
+    检查文本中的标签是否正确嵌套，并提取各标签内容
+
+    :param text: 待检查的文本
+    :return: {'content': {tag: [content, ...]}, 'tags_properly_nested': bool}
+    """
+    content, tags_properly_nested = _parse_nested_tags(text)
+    return {
+        'content': {tag: list(contents) for tag, contents in content},
+        'tags_properly_nested': tags_properly_nested,
+    }
 
 class AgentGroups:
+    """
+    代理组，负责按需加载各代理并编排项目定义、标签生成和数据表生成等工作流
+
+    :param agents_dir: 代理模块所在目录
+    :param max_workers: 共享线程池的线程数，即同时发出的 LLM 请求数上限，需结合模型服务的并发/限流配置调整
+    """
     
     HostMsg = partial(Msg, name="Moderator", role="assistant")
-    dumps_yaml = partial(yaml.dump, allow_unicode=True, default_flow_style=False)
+    PMMsg = partial(Msg, name="ProjectManager", role="assistant")
+    dumps_yaml = partial(yaml.dump, Dumper=_YamlDumper, allow_unicode=True, default_flow_style=False)
 
-    def __init__(self, agents_dir='agents'):
+    def __init__(self, agents_dir='agents', max_workers=4):
+        # 所有并行阶段共用的线程池，避免每次调用都重建线程
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ag')
         self.agents = {}
+        # 只记录类名到模块名的映射，首次 get_agent 时才导入并实例化
+        self._agent_specs = {}
+        self._agents_lock = threading.Lock()
+        self._user_agent = None  # 用户代理在首次 define_project 时创建并复用
         for filename in os.listdir(agents_dir):
             if filename.endswith('.py') and not filename.startswith('__'):
-                print(f"Importing {filename}")
                 module_name = filename[:-3]  # 去掉.py后缀
-                module = importlib.import_module(f'agents.{module_name}')
                 class_name = ''.join(word.capitalize() for word in module_name.split('_'))
-                if hasattr(module, class_name):
-                    agent_class = getattr(module, class_name)
-                    self.agents[class_name] = agent_class()
+                self._agent_specs[class_name] = module_name
     
     def get_agent(self, agent_name):
-        return self.agents.get(agent_name)
+        # 已缓存的代理直接返回，不必加锁
+        agent = self.agents.get(agent_name)
+        if agent is not None:
+            return agent
+        with self._agents_lock:
+            if agent_name not in self.agents:
+                module_name = self._agent_specs.get(agent_name)
+                if module_name is None:
+                    return None
+                print(f"Importing {module_name}.py")
+                module = importlib.import_module(f'agents.{module_name}')
+                if not hasattr(module, agent_name):
+                    return None
+                agent_class = getattr(module, agent_name)
+                self.agents[agent_name] = agent_class()
+            return self.agents[agent_name]
+
+    def close(self):
+        """
+        关闭共享线程池
+        """
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def process_data_file(self, file_path):
         """
@@ -82,19 +207,23 @@ class AgentGroups:
 
         :param file_path: 文件路径
         """
-        doc_screener = self.get_agent('DocScreener')
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext not in _TABLE_EXTS or os.path.basename(file_path).startswith('~$'):
+            return
+
+        # 未变化的文件直接跳过，避免调用DocScreener(LLM)
         table_screener = self.get_agent('TableScreener')
-        
-        if file_path.endswith(('.xlsx', '.xls', '.csv')) and '~$' not in file_path:
-        
-            print(f"Processing data file: {file_path}")
-            
-            if table_screener.is_file_unchanged(file_path):
-                print(f"File has not been changed: {file_path}")
-                return
+        if table_screener.is_file_unchanged(file_path):
+            print(f"File has not been changed: {file_path}")
+            return
+
+        print(f"Processing data file: {file_path}")
 
-            # 使用DocScreener分析文件    
-            doc_result = doc_screener(file_path)
+        # 使用DocScreener分析文件，每个文件使用独立的临时目录，避免并行处理同名文件时互相覆盖转换结果；
+        # 转换结果只在本函数内使用，处理完成后随目录一起删除
+        doc_screener = self.get_agent('DocScreener')
+        with tempfile.TemporaryDirectory(prefix='doc_screener_') as tmp_dir:
+            doc_result = doc_screener(file_path, tmp_dir=tmp_dir)
             
             if doc_result.metadata['doc_type'] in ['TABLE', 'UNFORMATTED_TABLE', 'ROW_HEADER_TABLE', 'COL_HEADER_TABLE', 'RAW_DATA_LIST']:
                 table_screener(file_path, doc_result.metadata['md_file_path'], doc_result)
@@ -153,11 +282,18 @@ class AgentGroups:
             # 处理单个文件
             self.process_data_file(input_path)
         elif os.path.isdir(input_path):
-            # 遍历目录中的所有文件
-            for root, _, files in os.walk(input_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    self.process_data_file(file_path)
+            # 遍历目录中的所有文件，各文件相互独立，并行调用LLM分析
+            futures = []
+            try:
+                for file_path in _iter_data_files(input_path):
+                    futures.append(self._executor.submit(self.process_data_file, file_path))
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                # 遍历目录或任一文件处理失败时取消尚未开始的任务，再抛出异常
+                for future in futures:
+                    future.cancel()
+                raise
         else:
             raise ValueError(f"Invalid input path: {input_path}")
 
@@ -170,13 +306,16 @@ class AgentGroups:
 
         print(f"{database_summary}\n\nBased on the database summary above, please provide your project requirements and objectives.")
         # 创建用户代理(UserAgent)，用于用户输入
-        user_agent = UserAgent()
+        if self._user_agent is None:
+            self._user_agent = UserAgent()
+        user_agent = self._user_agent
         
         user_requirements = f"Database Summary:\n{database_summary}\n\nUser Requirements:\n{user_agent().content}"
 
         # 步骤4：初始项目定义
         print("Step 4: Initial project definition...")
         current_definition = pm(prev="{}", msg=user_requirements)
+        cur_def_yaml = self.dumps_yaml(current_definition.metadata)
 
         # 步骤5：项目定义优化循环
         print("Step 5: Project definition optimization loop...")
@@ -188,22 +327,22 @@ class AgentGroups:
             print("Project Manager needs more information. Asking Table Analyst...")
             
             # 表格数据分析员提供见解
-            analyst_input = Msg(
-                name="ProjectManager",
-                role="assistant",
-                content=f"Provide insights based on more database analyze:\n\n{self.dumps_yaml(current_definition.metadata)}"
+            analyst_input = self.PMMsg(
+                content=f"Provide insights based on more database analyze:\n\n{cur_def_yaml}"
             )
             analyst_insights = table_analyst(analyst_input).content
             
             # 项目经理根据反馈修改定义
-            pm_revision_input = f"Analyst Insights:\n{analyst_insights}"
+            revision_parts = [f"Analyst Insights:\n{analyst_insights}"]
             if ds_review is not None:
-                pm_revision_input += f"\n----\n\nData Scientist Feedback:\n{ds_review.content}"
+                revision_parts.append(f"Data Scientist Feedback:\n{ds_review.content}")
             if master_decision is not None:
-                pm_revision_input += f"\n----\n\nProject Master Decision:\n{master_decision.content}"
+                revision_parts.append(f"Project Master Decision:\n{master_decision.content}")
+            pm_revision_input = "\n----\n\n".join(revision_parts)
                 
             pm_revision_input_str = self.dumps_yaml(pm_revision_input)
-            current_definition = pm(prev=self.dumps_yaml(current_definition.metadata) + "\n\n" + user_requirements, msg=pm_revision_input_str)
+            current_definition = pm(prev=cur_def_yaml + "\n\n" + user_requirements, msg=pm_revision_input_str)
+            cur_def_yaml = self.dumps_yaml(current_definition.metadata)
         
             # 检查项目经理是否需要更多信息
             if current_definition.metadata.get("continue_ask", False):
@@ -211,19 +350,20 @@ class AgentGroups:
                 print("Project Manager needs more information. Asking user...")
                 user_response = user_agent().content
                 user_requirements += f"\n\nAdditional User Information:\n{user_response}"
-                current_definition = pm(prev=self.dumps_yaml(current_definition.metadata), msg=user_response)
+                current_definition = pm(prev=cur_def_yaml, msg=user_response)
+                cur_def_yaml = self.dumps_yaml(current_definition.metadata)
                 continue
 
             print(f"Optimization round remain {review_times}...")
             remain_times -= 1
             
             # 数据科学家审查
-            ds_review = data_scientist(prev=self.dumps_yaml(current_definition.metadata) + "\n\n" + user_requirements, msg=f"\n\nDataAnalyst Insights:\n{analyst_insights}")
+            ds_review = data_scientist(prev=cur_def_yaml + "\n\n" + user_requirements, msg=f"\n\nDataAnalyst Insights:\n{analyst_insights}")
             
             master_decision = None
             if remain_times < review_times:
                 # 项目主管决策
-                master_decision = proj_master(project_definition=self.dumps_yaml(current_definition.metadata), 
+                master_decision = proj_master(project_definition=cur_def_yaml, 
                                             data_scientist_feedback=ds_review.content)
                 
                 if not master_decision.content.get("decision", False):
@@ -257,20 +397,7 @@ class AgentGroups:
         """
         
         # 加载标签配置
-        if isinstance(tag_config, str):
-            if os.path.isfile(tag_config):
-                with open(tag_config, "r", encoding='utf-8') as f:
-                    annotate_tags = yaml.safe_load(f)
-            else:
-                annotate_tags = yaml.safe_load(tag_config)
-        elif isinstance(tag_config, dict):
-            if isinstance(tag_config['tags'], str):
-                yaml_data = yaml.safe_load(tag_config['tags'])
-                annotate_tags = dict(yaml_data)
-            else:
-                annotate_tags = tag_config['tags']
-        else:
-            raise ValueError("Invalid tag_config format")
+        annotate_tags = _load_tag_config(tag_config)
         
         # 创建代理
         table_analyst = self.get_agent('TableAnalyst')
@@ -291,7 +418,7 @@ class AgentGroups:
                 
         # 初始化表头和标签
         table_headers = {}
-        prev_headers = []
+        prev_headers = set()  # 曾出现过的表头名，去重
 
         # 初始表头设计
         initial_headers = table_designer(
@@ -301,18 +428,19 @@ class AgentGroups:
             prev_headers="{}",
         )
         table_headers.update(initial_headers.content)
-        prev_headers.extend(initial_headers.content.keys())
+        prev_headers.update(initial_headers.content.keys())
+
+        # 序列化结果只在表头或标签变化后才重新计算
+        table_header_str = self.dumps_yaml(table_headers)
+        tags_yaml_str = self.dumps_yaml(annotate_tags)
+        prev_headers_str = self.dumps_yaml(sorted(prev_headers))
 
         # 开始优化循环
         for i in range(review_times):
             print(f"Optimization round {i+1}/{review_times}")
 
             # 表格数据分析阶段
-            table_header_str = self.dumps_yaml(table_headers)
-            tags_yaml_str = self.dumps_yaml(annotate_tags)
-            analyst_input = Msg(
-                name="ProjectManager",
-                role="assistant",
+            analyst_input = self.PMMsg(
                 content=("Analyze the database for designing table headers and annotation tags "
                          "based on the project definition, user requirements, "
                          "current table headers, and current tags:\n\n"
@@ -323,9 +451,10 @@ class AgentGroups:
             )
             analyst_insights = table_analyst(analyst_input).content
 
+            # 表格设计、标注标签设计和数据架构审核只依赖分析见解，互不依赖，并行调用
             # 表格设计阶段
-            prev_headers_str = self.dumps_yaml(prev_headers)
-            new_table_headers = table_designer(
+            headers_future = self._executor.submit(
+                table_designer,
                 project_definition=project_definition,
                 user_requirements=user_requirements,
                 analyst_insights=analyst_insights,
@@ -333,7 +462,8 @@ class AgentGroups:
             )
             
             # 标注标签设计阶段
-            new_tags = label_designer(
+            tags_future = self._executor.submit(
+                label_designer,
                 project_definition=project_definition,
                 user_requirements=user_requirements,
                 analyst_insights=analyst_insights,
@@ -342,46 +472,57 @@ class AgentGroups:
             )
             
             # 数据架构审核阶段
-            del_list = data_architect(
+            del_future = self._executor.submit(
+                data_architect,
                 project_definition=project_definition,
                 user_requirements=user_requirements,
                 analyst_insights=analyst_insights,
                 headers=table_header_str,
                 tags=tags_yaml_str,
             )
-            
-            # 更新表头和标签
-            old_headers = set(table_headers.keys())
-            old_tags = set(annotate_tags.keys())
 
-            for k, v in new_table_headers.content.items():
-                if k not in table_headers:
-                    table_headers[k] = v
-                    prev_headers.append(k)
-
-            for k, v in new_tags.content.items():
-                if k not in annotate_tags:
-                    annotate_tags[k] = v
-
-            # 删除指定的表头和标签
-            del_table_names = del_list.metadata.get('del_table_names', [])
+            new_table_headers = headers_future.result()
+            new_tags = tags_future.result()
+            del_list = del_future.result()
+            
+            # 更新表头和标签，记录本轮是否有修改
+            headers_changed = False
+            tags_changed = False
+
+            # 只追加新的键，已有的表头和标签保持原值和原顺序
+            added_headers = {k: v for k, v in new_table_headers.content.items() if k not in table_headers}
+            if added_headers:
+                table_headers.update(added_headers)
+                prev_headers.update(added_headers)
+                headers_changed = True
+
+            added_tags = {k: v for k, v in new_tags.content.items() if k not in annotate_tags}
+            if added_tags:
+                annotate_tags.update(added_tags)
+                tags_changed = True
+
+            # 删除指定的表头和标签，只处理实际存在的键
+            del_table_names = table_headers.keys() & set(del_list.metadata.get('del_table_names', []))
             for del_name in del_table_names:
-                if del_name in table_headers:
-                    del table_headers[del_name]
+                del table_headers[del_name]
+            headers_changed = headers_changed or bool(del_table_names)
 
-            del_label_names = del_list.metadata.get('del_label_names', [])
+            del_label_names = annotate_tags.keys() & set(del_list.metadata.get('del_label_names', []))
             for del_name in del_label_names:
-                if del_name in annotate_tags:
-                    del annotate_tags[del_name]
+                del annotate_tags[del_name]
+            tags_changed = tags_changed or bool(del_label_names)
 
             # 检查是否有变化
-            new_headers = set(table_headers.keys())
-            new_tags = set(annotate_tags.keys())
-
-            if old_headers == new_headers and old_tags == new_tags:
+            if not headers_changed and not tags_changed:
                 print(f"No changes detected after round {i+1}. Ending optimization.")
                 break
 
+            if headers_changed:
+                table_header_str = self.dumps_yaml(table_headers)
+                prev_headers_str = self.dumps_yaml(sorted(prev_headers))
+            if tags_changed:
+                tags_yaml_str = self.dumps_yaml(annotate_tags)
+
         # 返回最终的表头定义和标注标签定义
         return table_headers, annotate_tags
     
@@ -395,6 +536,11 @@ class AgentGroups:
         coding_dir_path,
         swe_template_path="agents/tools/swe_template/make_table.py"):
         
+        # 这些代理只在本流程中使用，按需导入以减少 utils 的导入开销
+        from agents.swe_agent import SWEAgent
+        from agents.sql_designer import SQLDesigner
+        from agents.data_extractor import DataExtractor
+
         print("开始执行 make_data_table 函数")
         print(f"数据库路径: {db_path}")
         print(f"返回表格路径: {return_table_path}")
@@ -526,31 +672,26 @@ class AgentGroups:
 
 
 if __name__ == "__main__":
-    import os
-    import sys
     import agentscope
-    from agentscope.message import Msg
-    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-    from goodrock_model_wrapper import GoodRockModelWrapper
     
     agentscope.init(
         model_configs="configs/model_configs.json"
     )
     
-    ag = AgentGroups("./agents")
     with open("temp/user_requirements.txt", 'r', encoding='utf-8') as f:
         user_requirements = f.read()
     with open("temp/final_definition.yaml", 'r', encoding='utf-8') as f:
         project_definition_input = f.read() 
     with open("temp/table_header.yaml", 'r', encoding='utf-8') as f:
         table_header_string = f.read()
-    ag.make_data_table(
-        user_requirements,
-        project_definition_input,
-        "project_data.db",
-        table_header_string,
-        "temp/result.csv",
-        "temp/coding")
+    with AgentGroups("./agents") as ag:
+        ag.make_data_table(
+            user_requirements,
+            project_definition_input,
+            "project_data.db",
+            table_header_string,
+            "temp/result.csv",
+            "temp/coding")
     
     
     
\ No newline at end of file